@@ -1,10 +1,11 @@
 """Caches an expensive computation, using an async function to compute.
 
 If another task tries retrieving while it's already being computed, the second waits for the existing
-task.
+task. If a maximum size is set, the least recently used values are discarded once it is exceeded.
 """
-from typing import Awaitable, Callable, Dict, Generic, Iterator, Tuple, TypeVar, Union
+from typing import Awaitable, Callable, Generic, Iterator, Optional, Tuple, TypeVar, Union
 from typing_extensions import ParamSpec
+from collections import OrderedDict
 
 import trio
 
@@ -14,12 +15,30 @@ ValueT = TypeVar('ValueT')
 Args = ParamSpec('Args')
 
 
+class _Pending(Generic[ValueT]):
+    """A value currently being computed.
+
+    Waiters keep a reference to this, so they still receive the result if it is evicted.
+    """
+    def __init__(self) -> None:
+        self.event = trio.Event()
+        self.done = False
+        self.result: Optional[ValueT] = None
+
+    def set(self, result: ValueT) -> None:
+        """Store the result, and wake the waiters."""
+        self.result = result
+        self.done = True
+        self.event.set()
+
+
 class ACache(Generic[KeyT, ValueT]):
     """Caches an expensive computation."""
-    _cache: Dict[KeyT, Union[ValueT, trio.Event]]
+    _cache: 'OrderedDict[KeyT, Union[ValueT, _Pending[ValueT]]]'
 
-    def __init__(self) -> None:
-        self._cache = {}
+    def __init__(self, maxsize: Optional[int] = None) -> None:
+        self._cache = OrderedDict()
+        self.maxsize = maxsize
 
     def load(self, key: KeyT, value: ValueT) -> None:
         """Load in a premade value."""
@@ -28,14 +47,16 @@ class ACache(Generic[KeyT, ValueT]):
         except KeyError:
             pass
         else:
-            if isinstance(existing, trio.Event):
-                existing.set()
+            if isinstance(existing, _Pending):
+                existing.set(value)
         self._cache[key] = value
+        self._cache.move_to_end(key)
+        self._evict(key)
 
     def __iter__(self) -> Iterator[Tuple[KeyT, ValueT]]:
         """Iterate through the currently cached items."""
         for key, value in self._cache.items():
-            if not isinstance(value, trio.Event):
+            if not isinstance(value, _Pending):
                 yield key, value
 
     def __len__(self) -> int:
@@ -45,6 +66,23 @@ class ACache(Generic[KeyT, ValueT]):
         """Remove all the contents."""
         self._cache.clear()
 
+    def _evict(self, keep: KeyT) -> None:
+        """Discard the least recently used values, if we exceed the maximum size.
+
+        Only computed values count towards the size, and the key just stored is never discarded.
+        """
+        if self.maxsize is None:
+            return
+        finished = [
+            key for key, value in self._cache.items()
+            if not isinstance(value, _Pending) and key != keep
+        ]
+        # The kept key counts towards the size too.
+        excess = len(finished) + 1 - self.maxsize
+        if excess > 0:
+            for key in finished[:excess]:
+                del self._cache[key]
+
     async def fetch(
         self, key: KeyT, func: Callable[Args, Awaitable[ValueT]],
         /, *args: Args.args, **kwargs: Args.kwargs,
@@ -54,18 +92,25 @@ class ACache(Generic[KeyT, ValueT]):
             try:
                 result = self._cache[key]
             except KeyError:
-                self._cache[key] = evt = trio.Event()
+                self._cache[key] = pending = _Pending[ValueT]()
                 try:
-                    self._cache[key] = result = await func(*args, **kwargs)
-                except Exception:
-                    # Undo everything.
-                    if self._cache[key] is evt:
+                    result = await func(*args, **kwargs)
+                except BaseException:
+                    # Undo everything, waiters will then retry.
+                    if self._cache.get(key) is pending:
                         del self._cache[key]
+                    pending.event.set()
                     raise
-                finally:
-                    evt.set()
+                if self._cache.get(key) is pending:
+                    self._cache[key] = result
+                    self._cache.move_to_end(key)
+                    self._evict(key)
+                pending.set(result)
                 return result
-            if isinstance(result, trio.Event):
-                await result.wait()
+            if isinstance(result, _Pending):
+                await result.event.wait()
+                if result.done:
+                    return result.result  # type: ignore[return-value]
                 continue
+            self._cache.move_to_end(key)
             return result
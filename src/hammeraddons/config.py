@@ -405,7 +405,7 @@ PROPCOMBINE_CROWBAR = Opt.boolean(
 
 PROPCOMBINE_CACHE = Opt.string(
     'propcombine_cache', f"|{PATH_KEY_GAME}|/decomp_cache/",
-    """Cache location for models decompiled for combining."""
+    """Cache location for models decompiled for combining, and parsed SMD meshes."""
 )
 
 PROPCOMBINE_VOLUME_TOLERANCE = Opt.floating(
@@ -10,9 +10,9 @@ from typing import (
 )
 from typing_extensions import Self
 from pathlib import Path
+import itertools
 import os
 import pickle
-import random
 import tempfile
 import contextlib
 
@@ -63,8 +63,10 @@ class ModelCompiler(Generic[ModelKey, InT, OutT]):
         # The models already constructed.
         self._built_models: ACache[ModelKey, GenModel[OutT]] = ACache()
 
-        # The random indexes we use to produce filenames.
+        # The names already used for models.
         self._mdl_names: Set[str] = set()
+        # Produces indexes for new model names, skipping any in _mdl_names.
+        self._name_counter = itertools.count()
 
         self.game: Game = game
         self.model_folder = f'maps/{map_name}/{folder_name}/'
@@ -73,7 +75,8 @@ class ModelCompiler(Generic[ModelKey, InT, OutT]):
         self.version = version
         self.studiomdl_loc = studiomdl_loc
         self.compile_dir = (compile_dir / folder_name) if compile_dir is not None else None
-        self.limiter = trio.CapacityLimiter(8)
+        # StudioMDL is single-threaded, so run one compile per core.
+        self.limiter = trio.CapacityLimiter(os.cpu_count() or 8)
         self.pack_models = pack_models
         # For statistics, the number we built this compile
         self.built_count = 0
@@ -102,6 +105,19 @@ class ModelCompiler(Generic[ModelKey, InT, OutT]):
         # Ensure the folder exists.
         os.makedirs(self.model_folder_abs, exist_ok=True)
 
+        # Names are allocated sequentially, so always skip existing files. Otherwise, a new model
+        # could be mixed with leftover files from an old one, even if the .mdl itself is gone.
+        existing_mdls: Set[str] = set()
+        with os.scandir(self.model_folder_abs) as scanner:
+            for entry in scanner:
+                # Split at the first dot, the same as __exit__() does when culling.
+                stem, dot, ext = entry.name.partition('.')
+                ext = dot + ext.casefold()
+                if ext in MDL_EXTS:
+                    self._mdl_names.add(stem.casefold())
+                    if ext == '.mdl':
+                        existing_mdls.add(stem.casefold())
+
         if force_regen:
             return self  # Skip loading.
 
@@ -129,9 +145,6 @@ class ModelCompiler(Generic[ModelKey, InT, OutT]):
             # Different version, ignore the data.
             return self
 
-        for mdl_name in self.model_folder_abs.glob('*.mdl'):
-            self._mdl_names.add(str(mdl_name.stem).casefold())
-
         for tup in data:
             try:
                 key, name, mdl_result = tup
@@ -139,7 +152,7 @@ class ModelCompiler(Generic[ModelKey, InT, OutT]):
                     continue
             except ValueError:
                 continue  # Malformed, ignore.
-            if name in self._mdl_names:
+            if name.casefold() in existing_mdls:
                 self._built_models.load(key, GenModel(name, mdl_result))
             else:
                 LOGGER.warning('Model in manifest but not present: {}', name)
@@ -164,18 +177,17 @@ class ModelCompiler(Generic[ModelKey, InT, OutT]):
             pickle.dump((data, self.version), f, pickle.HIGHEST_PROTOCOL)
 
         culled = 0
-        for mdl_file in self.model_folder_abs.glob('*'):
-            if mdl_file.suffix not in {'.mdl', '.phy', '.vtx', '.vvd'}:
-                continue
-
-            # Strip all suffixes.
-            if mdl_file.name[:mdl_file.name.find('.')].casefold() in used_mdls:
-                continue
-            culled += 1
-            try:
-                mdl_file.unlink()
-            except FileNotFoundError:
-                pass
+        with os.scandir(self.model_folder_abs) as scanner:
+            for entry in scanner:
+                # Split at the first dot, so we get the full '.dx90.vtx' style extensions.
+                stem, dot, ext = entry.name.partition('.')
+                if dot + ext.casefold() not in MDL_EXTS or stem.casefold() in used_mdls:
+                    continue
+                culled += 1
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
 
         LOGGER.info('Culled {} models in models/{}*', culled, self.model_folder)
 
@@ -232,12 +244,11 @@ class ModelCompiler(Generic[ModelKey, InT, OutT]):
     ) -> GenModel[OutT]:
         """Actually build the model."""
         self.built_count += 1
-        # Figure out a name to use.
-        while True:
-            mdl_name = 'mdl_{:04x}'.format(random.getrandbits(16))
-            if mdl_name not in self._mdl_names:
-                self._mdl_names.add(mdl_name)
-                break
+        # Figure out a name to use. Skip past any left over from previous compiles.
+        mdl_name = 'mdl_{:04x}'.format(next(self._name_counter))
+        while mdl_name in self._mdl_names:
+            mdl_name = 'mdl_{:04x}'.format(next(self._name_counter))
+        self._mdl_names.add(mdl_name)
 
         # If compile dir is specified, create the folder/clear it, but don't delete once done.
         ctx_man: ContextManager[Union[str, Path]]
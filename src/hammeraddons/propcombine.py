@@ -5,23 +5,30 @@ draw call.
 """
 import math
 from typing import (
-    Callable, Dict, FrozenSet, Iterable, Iterator, List, Literal, MutableMapping, Optional, Set,
-    Tuple,
+    Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Literal, MutableMapping, Optional,
+    Set, Tuple,
     Union, Sequence,
 )
 from collections import defaultdict
 from enum import Enum
 from pathlib import Path
 from tempfile import TemporaryDirectory
+import bisect
 import fnmatch
+import functools
+import gzip
+import hashlib
 import itertools
 import operator
 import os
+import pickle
 import re
 import shutil
+import struct
+import sys
 
 from srctools import (
-    VMF, Entity, FileSystemChain, KeyValError, Keyvalues, bool_as_int, conv_int,
+    VMF, AtomicWriter, Entity, FileSystemChain, KeyValError, Keyvalues, bool_as_int, conv_int,
 )
 from srctools.bsp import BSP, BModel, StaticProp, StaticPropFlags, VisLeaf
 from srctools.game import Game
@@ -61,6 +68,11 @@ class QC:
     phy_scale: float  # Scale of collision model.
     is_concave: bool  # If the collision model is known to be concave.
 
+
+class MalformedQC(Exception):
+    """Raised by parse_qc() if a QC is missing its model name or reference mesh."""
+
+
 QC_TEMPLATE = '''\
 $staticprop
 $modelname "{path}"
@@ -85,26 +97,45 @@ MAX_GROUP = 24  # StudioMDL doesn't allow more than this...
 # Exceed 65k triangles and StudioMDL cuts into multiple bodygroups. So at that point we should
 # produce multiple grouped props. Shrink a little just for breathing room.
 MAX_VERTS = 65536//3 - 64
+# SMDs are rotated by this when appended, see compile_func().
+YAW_90 = Matrix.from_yaw(90)
+
+# Filename used to cache parsed QCs in each QC folder. Increment the version to invalidate.
+QC_CACHE_NAME = '.propcombine_qc_cache.bin'
+QC_CACHE_VERSION = 2
+# Parsed SMDs are pickled into this subfolder of the decompile cache, if that's set.
+# There's one file per SMD path. Stale files are removed when they are next loaded, but files for
+# SMDs which are never used again are left behind, in the same way as decompiled models.
+MESH_CACHE_NAME = 'mesh_cache'
+MESH_CACHE_VERSION = 1
 
 
 # Cache of the SMD models we have already parsed, so we don't need
 # to parse them again. For the collision model, we store them pre-split.
-_mesh_cache: ACache[Tuple[QC, int], Mesh] = ACache()
-_coll_cache: ACache[Tuple[Optional[str], CollType], List[Mesh]] = ACache()
+# These are limited in size, so memory use doesn't grow forever on maps with many models.
+MAX_MESH_CACHE = 128
+_mesh_cache: ACache[Tuple[QC, int], Mesh] = ACache(MAX_MESH_CACHE)
+_coll_cache: ACache[Tuple[Optional[str], CollType], List[Mesh]] = ACache(MAX_MESH_CACHE)
+# Where to persist parsed SMDs between compiles, set by combine().
+_mesh_cache_loc: Optional[Path] = None
 
 # Limit the amount of decompile/recompiles we do simultaneously.
 LIM_PROCESS = trio.CapacityLimiter(8)
 LIM_PARSE = trio.CapacityLimiter(16)
 
 
-def unify_mdl(path: str):
-    """Compute a 'canonical' path for a given model."""
+@functools.lru_cache(maxsize=None)
+def unify_mdl(path: str) -> str:
+    """Compute a 'canonical' path for a given model.
+
+    This is called for every prop, so the results are cached and interned.
+    """
     path = path.casefold().replace('\\', '/')
     if not path.startswith('models/'):
         path = 'models/' + path
     if not path.endswith('.mdl'):
         path = path + '.mdl'
-    return path
+    return sys.intern(path)
 
 
 class CombineVolume:
@@ -117,6 +148,9 @@ class CombineVolume:
         self.used = False
         self.mins: Optional[Vec] = None
         self.maxes: Optional[Vec] = None
+        # World-space bounds enclosing all the rotated volumes, for quickly rejecting points.
+        self.bound_min = Vec(math.inf, math.inf, math.inf)
+        self.bound_max = Vec(-math.inf, -math.inf, -math.inf)
         # Each volume in the group, specifying its collision behaviour.
         self.collision: List[Callable[[Vec], bool]] = []
 
@@ -125,8 +159,18 @@ class CombineVolume:
         else:
             self._desc_start = f'at {origin}'
 
+    def add_bounds(self, origin: Vec, angles: Angle, mins: Vec, maxes: Vec) -> None:
+        """Expand the rejection bounds to include a local bounding box, rotated and offset."""
+        matrix = Matrix.from_angle(angles)
+        for x, y, z in itertools.product((mins.x, maxes.x), (mins.y, maxes.y), (mins.z, maxes.z)):
+            pos = Vec(x, y, z) @ matrix + origin
+            self.bound_min.min(pos)
+            self.bound_max.max(pos)
+
     def contains(self, point: Vec) -> bool:
         """Check if the volume contains this point."""
+        if not point.in_bbox(self.bound_min, self.bound_max):
+            return False
         return any(coll(point) for coll in self.collision)
 
     def __str__(self) -> str:
@@ -185,14 +229,44 @@ class PropPos:
 
 # The types used during compilation.
 PropCombiner = ModelCompiler[
-    Tuple[FrozenSet[PropPos], bool],  # Key for deduplication.
+    bytes,  # Digest of the props, for deduplication.
     # Additional parameters used during compile
-    Tuple[Callable[[str], Union[Tuple[QC, Model], Tuple[None, None]]], float],
+    Tuple[
+        FrozenSet[PropPos], bool,
+        Callable[[str], Union[Tuple[QC, Model], Tuple[None, None]]], float,
+    ],
     # Result of the function
     None,
 ]
 
 
+def prop_key(prop_pos: Iterable[PropPos], has_coll: bool) -> bytes:
+    """Compute a digest identifying this set of props, used to reuse previous compiles.
+
+    Each prop is packed into bytes, then sorted so the order of the props doesn't matter.
+    Adding 0.0 converts -0.0 into 0.0, since those compare equal but pack differently.
+    """
+    chunks: List[bytes] = []
+    for prop in prop_pos:
+        model = prop.model.encode('utf8')
+        chunks.append(struct.pack(
+            '<9diB4sH',
+            prop.x + 0.0, prop.y + 0.0, prop.z + 0.0,
+            prop.pit + 0.0, prop.yaw + 0.0, prop.rol + 0.0,
+            prop.scale_x + 0.0, prop.scale_y + 0.0, prop.scale_z + 0.0,
+            prop.skin, prop.solidity.value,
+            prop.checksum,
+            len(model),
+        ) + model)
+    chunks.sort()
+
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(b'\x01' if has_coll else b'\x00')
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.digest()
+
+
 async def combine_group(
     compiler: PropCombiner,
     props: List[StaticProp],
@@ -229,11 +303,17 @@ async def combine_group(
 
     prop_pos = set()
     for prop in props:
-        origin = round((prop.origin - avg_pos) @ yaw_rot, 7)
+        origin = prop.origin - avg_pos
+        # Usually everything is axis-aligned, so skip the rotation.
+        if avg_yaw:
+            origin @= yaw_rot
+        origin = round(origin, 7)
+        # Don't modify the prop's own angles, in case it isn't used.
+        # Wrap these the same way Angle does.
         angles = prop.angles
-        angles.pitch = round(angles.pitch, 7)
-        angles.yaw = round(angles.yaw - avg_yaw, 7)
-        angles.roll = round(angles.roll, 7)
+        pitch = round(angles.pitch, 7) % 360.0
+        yaw = round(angles.yaw - avg_yaw, 7) % 360.0
+        roll = round(angles.roll, 7) % 360.0
         try:
             coll = CollType(prop.solidity)
         except ValueError:
@@ -255,8 +335,8 @@ async def combine_group(
             scale_x, scale_y, scale_z = scale
         prop_pos.add(PropPos(
             origin.x, origin.y, origin.z,
-            angles.pitch, angles.yaw, angles.roll,
-            prop.model,
+            pitch, yaw, roll,
+            unify_mdl(prop.model),
             mdl.checksum,
             prop.skin,
             scale_x,
@@ -267,8 +347,8 @@ async def combine_group(
     # We don't want to build collisions if it's not used.
     has_coll = any(pos.solidity is not CollType.NONE for pos in prop_pos)
     mdl_name, _ = await compiler.get_model(
-        (frozenset(prop_pos), has_coll),
-        compile_func, (lookup_model, volume_tolerance),
+        prop_key(prop_pos, has_coll),
+        compile_func, (frozenset(prop_pos), has_coll, lookup_model, volume_tolerance),
     )
 
     # Many of these we require to be the same, so we can read them
@@ -288,15 +368,17 @@ async def combine_group(
 
 
 async def compile_func(
-    mdl_key: Tuple[FrozenSet[PropPos], bool],
+    mdl_key: bytes,
     temp_folder: Path,
     mdl_name: str,
-    args: Tuple[Callable[[str], Union[Tuple[QC, Model], Tuple[None, None]]], float],
+    args: Tuple[
+        FrozenSet[PropPos], bool,
+        Callable[[str], Union[Tuple[QC, Model], Tuple[None, None]]], float,
+    ],
 ) -> None:
     """Build this merged model."""
     LOGGER.info('Compiling {}...', mdl_name)
-    prop_pos, has_coll = mdl_key
-    lookup_model, volume_tolerance = args
+    prop_pos, has_coll, lookup_model, volume_tolerance = args
 
     # Unify these properties.
     surfprops: Set[str] = set()
@@ -336,9 +418,12 @@ async def compile_func(
         child_ref = await _mesh_cache.fetch((qc, prop.skin), build_reference, prop, qc, mdl)
         child_coll = await _coll_cache.fetch((qc.phy_smd, prop.solidity), build_collision, qc, prop, child_ref, volume_tolerance > 0)
 
-        scale = Vec(prop.scale_x, prop.scale_y, prop.scale_z)
+        # For some reason all the SMDs are rotated badly, but only if we append them.
+        # So rotate by 90 degrees of yaw first, as part of the same transform.
+        # Scaling happens before rotation, so the X and Y scales need to be swapped to match.
+        scale = Vec(prop.scale_y, prop.scale_x, prop.scale_z)
         offset = Vec(prop.x, prop.y, prop.z)
-        rot_matrix = Matrix.from_angle(prop.pit, prop.yaw, prop.rol)
+        rot_matrix = YAW_90 @ Matrix.from_angle(prop.pit, prop.yaw, prop.rol)
 
         ref_mesh.append_model(child_ref, rot_matrix, offset, scale * qc.ref_scale)
 
@@ -447,25 +532,22 @@ async def build_reference(prop: PropPos, qc: QC, mdl: Model) -> Mesh:
     """Load and parse the reference SMD."""
     LOGGER.info('Parsing ref "{}#{}"', qc.ref_smd, prop.skin)
     async with LIM_PARSE:
-        with open(qc.ref_smd, 'rb') as fb:
-            mesh = await trio.to_thread.run_sync(Mesh.parse_smd, fb)
+        mesh = await trio.to_thread.run_sync(load_smd, qc.ref_smd, _mesh_cache_loc)
 
     if prop.skin != 0 and prop.skin < len(mdl.skins):
         # We need to rename the materials to match the skin.
-        swap_skins = dict(zip(
-            mdl.skins[0],
-            mdl.skins[prop.skin]
-        ))
-        for tri in mesh.triangles:
-            tri.mat = swap_skins.get(tri.mat, tri.mat)
-
-    # For some reason all the SMDs are rotated badly, but only
-    # if we append them.
-    rot = Matrix.from_yaw(90)
-    for tri in mesh.triangles:
-        for vert in tri:
-            vert.pos @= rot
-            vert.norm @= rot
+        # Skip materials the skin doesn't change, and the whole mesh if it changes none.
+        swap_skins = {
+            orig: new
+            for orig, new in zip(mdl.skins[0], mdl.skins[prop.skin])
+            if orig != new
+        }
+        if swap_skins:
+            for tri in mesh.triangles:
+                new_mat = swap_skins.get(tri.mat)
+                if new_mat is not None:
+                    tri.mat = new_mat
+    # This is left in the original orientation, compile_func() rotates while appending.
     return mesh
 
 
@@ -479,14 +561,7 @@ async def build_collision(qc: QC, prop: PropPos, ref_mesh: Mesh, needs_split: bo
 
         LOGGER.info('Parsing coll "{}"', qc.phy_smd)
         async with LIM_PARSE:
-            with open(qc.phy_smd, 'rb') as fb:
-                coll = await trio.to_thread.run_sync(Mesh.parse_smd, fb)
-
-        rot = Matrix.from_yaw(90)
-        for tri in coll.triangles:
-            for vert in tri:
-                vert.pos @= rot
-                vert.norm @= rot
+            coll = await trio.to_thread.run_sync(load_smd, qc.phy_smd, _mesh_cache_loc)
 
         if qc.is_concave and needs_split:
             return await trio.to_thread.run_sync(coll.split_collision)
@@ -550,44 +625,161 @@ def optimise_collision(
             coll_mesh.triangles += mesh1.triangles
 
 
+def load_smd(smd_path: str, cache_loc: Optional[Path]) -> Mesh:
+    """Parse an SMD file, reusing the copy pickled into the cache folder if it is unchanged.
+
+    This returns a fresh mesh each time, so callers are free to modify it.
+    """
+    if cache_loc is None:
+        with open(smd_path, 'rb') as fb:
+            return Mesh.parse_smd(fb)
+
+    stat = os.stat(smd_path)
+    key = hashlib.sha1(smd_path.encode('utf8')).hexdigest()
+    cache_path = cache_loc / f'{key}.pkl.gz'
+    stale = False
+    try:
+        with gzip.open(cache_path, 'rb') as gz_in:
+            result: Any = pickle.load(gz_in)
+        version, path, mtime, size, mesh = result
+        if (
+            version == MESH_CACHE_VERSION and path == smd_path
+            and mtime == stat.st_mtime_ns and size == stat.st_size
+        ):
+            return mesh
+        stale = True
+    except FileNotFoundError:
+        pass
+    except Exception:
+        LOGGER.warning('Could not parse mesh cache "{}":', cache_path, exc_info=True)
+        stale = True
+    if stale:
+        # Remove it now, so it isn't left behind if the SMD no longer parses.
+        try:
+            cache_path.unlink()
+        except OSError:
+            pass
+
+    with open(smd_path, 'rb') as fb:
+        mesh = Mesh.parse_smd(fb)
+    data = (MESH_CACHE_VERSION, smd_path, stat.st_mtime_ns, stat.st_size, mesh)
+    try:
+        cache_loc.mkdir(parents=True, exist_ok=True)
+        with AtomicWriter(cache_path, is_bytes=True) as raw, gzip.GzipFile(
+            fileobj=raw, mode='wb', compresslevel=1,
+        ) as gz:
+            pickle.dump(data, gz, pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        LOGGER.warning('Could not write mesh cache "{}":', cache_path, exc_info=True)
+    return mesh
+
+
 def load_qcs(qc_folder: Path) -> Iterator[Tuple[str, QC]]:
-    """Parse through all the QC files to match to compiled models."""
-    for dirpath, dirnames, filenames in os.walk(str(qc_folder)):
-        qc_loc = Path(dirpath)
-        for fname in filenames:
-            if not fname.endswith('.qc'):
-                continue
-            qc_path = qc_loc / fname
+    """Parse through all the QC files to match to compiled models.
 
-            qc_result = parse_qc(qc_loc, qc_path)
+    Results are cached in the folder, so QCs are only parsed again if their modification time
+    or size changes. Warnings are cached alongside, and logged again on each run.
+    """
+    cache_path = qc_folder / QC_CACHE_NAME
+    cache: Dict[str, Tuple[int, int, Optional[Tuple[str, QC]], Optional[str]]] = {}
+    try:
+        with cache_path.open('rb') as fb:
+            result: Any = pickle.load(fb)
+        data, version = result
+        if version == QC_CACHE_VERSION:
+            cache = data
+    except FileNotFoundError:
+        pass
+    except Exception:
+        LOGGER.warning('Could not parse QC cache "{}":', cache_path, exc_info=True)
 
-            if qc_result is None:
-                # It's a dynamic QC, we can't combine.
-                continue
+    new_cache: Dict[str, Tuple[int, int, Optional[Tuple[str, QC]], Optional[str]]] = {}
+    changed = False
+    for entry in iter_qcs(str(qc_folder)):
+        stat = entry.stat()
+        try:
+            mtime, size, qc_result, warning = cache[entry.path]
+        except KeyError:
+            mtime = size = -1
+            qc_result = warning = None
+        if mtime != stat.st_mtime_ns or size != stat.st_size:
+            qc_path = Path(entry.path)
+            qc_result, warning = load_qc(qc_path.parent, qc_path)
+            changed = True
+        new_cache[entry.path] = (stat.st_mtime_ns, stat.st_size, qc_result, warning)
+        if warning is not None:
+            LOGGER.warning('{}', warning)
+        if qc_result is not None:
+            yield qc_result
+
+    if changed or len(new_cache) != len(cache):
+        try:
+            with AtomicWriter(cache_path, is_bytes=True) as fb:
+                pickle.dump((new_cache, QC_CACHE_VERSION), fb, pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            LOGGER.warning('Could not write QC cache "{}":', cache_path, exc_info=True)
 
-            (
-                model_name, is_concave,
-                ref_scale, ref_smd,
-                phy_scale, phy_smd,
-            ) = qc_result
 
-            # We can't parse non-SMD files.
-            if ref_smd.suffix.casefold() != '.smd':
-                LOGGER.warning('Reference mesh not a SMD:\n{}', ref_smd)
-                continue
+def iter_qcs(root: str) -> Iterator['os.DirEntry[str]']:
+    """Recursively find all QC files in a folder.
 
-            if phy_smd is not None and phy_smd.suffix.casefold() != '.smd':
-                LOGGER.warning('Collision mesh not a SMD:\n{}', ref_smd)
-                continue
+    This uses scandir() directly, so the directory entries can be used to stat the files
+    without constructing paths for every file in the tree.
+    """
+    todo = [root]
+    while todo:
+        try:
+            scanner = os.scandir(todo.pop())
+        except OSError:
+            continue
+        subdirs: List[str] = []
+        with scanner:
+            for entry in scanner:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                elif entry.name.endswith('.qc'):
+                    yield entry
+        # Push in reverse, so they're popped in listing order. This matches os.walk(), which
+        # load_qcs() relies on for which duplicate QC wins.
+        todo.extend(reversed(subdirs))
+
+
+def load_qc(qc_loc: Path, qc_path: Path) -> Tuple[Optional[Tuple[str, QC]], Optional[str]]:
+    """Parse a single QC file, and check if it can be used for combining.
+
+    This returns the result, and the warning to log if it can't be used.
+    """
+    try:
+        qc_result = parse_qc(qc_loc, qc_path)
+    except MalformedQC as exc:
+        return None, str(exc)
 
-            yield unify_mdl(model_name), QC(
-                str(qc_path).replace('\\', '/'),
-                str(ref_smd).replace('\\', '/'),
-                str(phy_smd).replace('\\', '/') if phy_smd else None,
-                ref_scale,
-                phy_scale,
-                is_concave,
-            )
+    if qc_result is None:
+        # It's a dynamic QC, we can't combine.
+        return None, None
+
+    (
+        model_name, is_concave,
+        ref_scale, ref_smd,
+        phy_scale, phy_smd,
+    ) = qc_result
+
+    # We can't parse non-SMD files.
+    if ref_smd.suffix.casefold() != '.smd':
+        return None, f'Reference mesh not a SMD:\n{ref_smd}'
+
+    if phy_smd is not None and phy_smd.suffix.casefold() != '.smd':
+        return None, f'Collision mesh not a SMD:\n{ref_smd}'
+
+    return (unify_mdl(model_name), QC(
+        str(qc_path).replace('\\', '/'),
+        str(ref_smd).replace('\\', '/'),
+        str(phy_smd).replace('\\', '/') if phy_smd else None,
+        ref_scale,
+        phy_scale,
+        is_concave,
+    )), None
 
 
 def parse_qc(qc_loc: Path, qc_path: Path) -> Optional[Tuple[
@@ -595,7 +787,10 @@ def parse_qc(qc_loc: Path, qc_path: Path) -> Optional[Tuple[
     float, Path,
     float, Optional[Path],
 ]]:
-    """Parse a single QC file."""
+    """Parse a single QC file.
+
+    If it is missing required commands, MalformedQC is raised.
+    """
     model_name = ref_smd = phy_smd = None
     scale_factor = ref_scale = phy_scale = 1.0
     is_concave = False
@@ -688,9 +883,7 @@ def parse_qc(qc_loc: Path, qc_path: Path) -> Optional[Tuple[
                     raise tok.error("EOF reached without closing brace (})!")
 
     if model_name is None or ref_smd is None:
-        # Malformed...
-        LOGGER.warning('Cannot parse "{}"... ({}, {})', qc_path, model_name, ref_smd)
-        return None
+        raise MalformedQC(f'Cannot parse "{qc_path}"... ({model_name}, {ref_smd})')
 
     return (
         model_name, is_concave,
@@ -767,7 +960,11 @@ async def decompile_model(
     # There should now be a QC file here.
     for qc_path in cache_folder.glob('*.qc'):
         LOGGER.debug('Parse decompiled QC "{}"...', qc_path)
-        qc_result = await trio.to_thread.run_sync(parse_qc, cache_folder, qc_path)
+        try:
+            qc_result = await trio.to_thread.run_sync(parse_qc, cache_folder, qc_path)
+        except MalformedQC as exc:
+            LOGGER.warning('{}', exc)
+            qc_result = None
         break
     else:  # not found.
         LOGGER.warning('No QC outputted into {}', cache_folder)
@@ -803,19 +1000,23 @@ async def decompile_model(
         cache_kv['ref'] = ''  # Mark as not present.
 
     with info_path.open('w') as f:
-        for line in cache_kv.export():
-            f.write(line)
+        f.writelines(cache_kv.export())
     return qc
 
 
 def group_props_ent(
-    prop_groups: Dict[Optional[tuple], List[StaticProp]],
+    prop_groups: Dict[Optional[tuple], Set[StaticProp]],
+    prop_order: Dict[StaticProp, int],
     get_model: Callable[[str], Tuple[Optional[QC], Optional[Model]]],
+    get_texture_set: Callable[[Model, int], FrozenSet[str]],
     brush_models: MutableMapping[Entity, BModel],
     grouper_ents: List[Entity],
     min_cluster: int,
 ) -> Iterator[List[StaticProp]]:
-    """Given the groups of props, merge props according to the provided ents."""
+    """Given the groups of props, merge props according to the provided ents.
+
+    Props in each volume are grouped in prop_order, so vert limit splits don't move around.
+    """
     # Ents with group names. We have to split those by filter too.
     grouped_sets: Dict[Tuple[str, FrozenSet[str]], CombineVolume] = {}
     # Skinset filter -> volumes that match.
@@ -831,11 +1032,7 @@ def group_props_ent(
         if mdl_name:
             qc, mdl = get_model(mdl_name)
             if mdl is not None:
-                skinset = frozenset({
-                    tex.casefold().replace('\\', '/')
-                    for tex in
-                    mdl.iter_textures([conv_int(ent['skin'])])
-                })
+                skinset = get_texture_set(mdl, conv_int(ent['skin']))
 
         angles = Angle.from_str(ent['angles'])
 
@@ -874,6 +1071,7 @@ def group_props_ent(
             maxes += 0.05
             combine_set.volume += size.x * size.y * size.z
             combine_set.collision.append(make_collision_bbox(origin, angles, mins, maxes))
+            combine_set.add_bounds(origin, angles, mins, maxes)
         elif ent['classname'] == 'comp_propcombine_volume':
             # Brushwork collision. Pop from the dict, so the brush model is removed.
             try:
@@ -887,6 +1085,8 @@ def group_props_ent(
             size = brush.maxes - brush.mins
             combine_set.volume += size.x * size.y * size.z
             combine_set.collision.append(make_collision_brush(origin, angles, brush))
+            # Pad slightly, so points on the surface aren't rejected.
+            combine_set.add_bounds(origin, angles, brush.mins - 1.0, brush.maxes + 1.0)
             if combine_set.mins is None:
                 combine_set.mins = brush.origin + brush.mins
             else:
@@ -916,10 +1116,18 @@ def group_props_ent(
             group.clear()
             continue
 
+        # Sort by X, so a binary search finds the props which could be inside each volume.
+        # Props grouped by an earlier volume are still in this list, so check the group too.
+        by_x = sorted(group, key=lambda prop: (prop.origin.x, prop_order[prop]))
+        by_x_pos = [prop.origin.x for prop in by_x]
+
         for combine_set in itertools.chain(sets_by_skin.get(group_skinset, ()), unfiltered_group):
             found = []
-            for prop in list(group):
-                if combine_set.contains(prop.origin):
+            start = bisect.bisect_left(by_x_pos, combine_set.bound_min.x)
+            end = bisect.bisect_right(by_x_pos, combine_set.bound_max.x)
+            # Go back to the original order, so vert limit splits happen in the same places.
+            for prop in sorted(by_x[start:end], key=prop_order.__getitem__):
+                if prop in group and combine_set.contains(prop.origin):
                     found.append(prop)
                     combine_set.used = True
 
@@ -941,15 +1149,13 @@ def group_props_ent(
                     # Output this prop, then start a new group.
                     if len(actual) >= min_cluster:
                         yield list(actual)
-                        for sub_prop in actual:
-                            group.remove(sub_prop)
+                        group.difference_update(actual)
                     actual.clear()
                     total_verts = mdl.total_verts
                 actual.append(prop)
             if len(actual) >= min_cluster:
                 yield list(actual)
-                for prop in actual:
-                    group.remove(prop)
+                group.difference_update(actual)
 
     # And log unused groups
     for combine_set_list in sets_by_skin.values():
@@ -959,16 +1165,32 @@ def group_props_ent(
 
 
 def group_props_auto(
-    prop_groups: Dict[Optional[tuple], List[StaticProp]],
+    prop_groups: Dict[Optional[tuple], Set[StaticProp]],
+    prop_order: Dict[StaticProp, int],
     get_model: Callable[[str], Tuple[Optional[QC], Optional[Model]]],
     min_dist: float,
     max_dist: float,
     min_cluster: int,
 ) -> Iterator[List[StaticProp]]:
-    """Given the groups of props, automatically find close props to merge."""
+    """Given the groups of props, automatically find close props to merge.
+
+    The groups are sets, so props are always visited in prop_order to give the same clusters
+    each compile.
+    """
     min_dist_sq = min_dist * min_dist
     max_dist_sq = max_dist * max_dist
     neighbours: Dict[StaticProp, Sequence[StaticProp]] = {}
+    # Props are bucketed into cells the size of the search radius, so any neighbours
+    # must be in the 3x3x3 cells surrounding a prop.
+    grid: Dict[Tuple[int, int, int], List[StaticProp]] = defaultdict(list)
+
+    def grid_cell(pos: Vec) -> Tuple[int, int, int]:
+        """Compute the grid cell a position is in."""
+        return (
+            math.floor(pos.x / min_dist),
+            math.floor(pos.y / min_dist),
+            math.floor(pos.z / min_dist),
+        )
 
     def find_neighbours(start: StaticProp) -> Sequence[StaticProp]:
         """Find props within dist from the specified one."""
@@ -976,8 +1198,11 @@ def group_props_auto(
             return neighbours[start]
         except KeyError:
             pass
+        x, y, z = grid_cell(start.origin)
         neigh = [
-            prop for prop in group
+            prop
+            for cell in itertools.product((x - 1, x, x + 1), (y - 1, y, y + 1), (z - 1, z, z + 1))
+            for prop in grid.get(cell, ())
             if (prop.origin - start.origin).mag_sq() <= min_dist_sq
         ]
         neighbours[start] = neigh
@@ -993,13 +1218,18 @@ def group_props_auto(
             continue
 
         # DBSCAN algorithm.
-        labels: Dict[StaticProp, Union[int, Literal['noise', 'unset']]] = dict.fromkeys(group, UNSET)
+        labels: Dict[StaticProp, Union[int, Literal['noise', 'unset']]] = dict.fromkeys(
+            sorted(group, key=prop_order.__getitem__), UNSET,
+        )
         neighbours.clear()
+        grid.clear()
+        for prop in labels:
+            grid[grid_cell(prop.origin)].append(prop)
         cluster_ind = 0
 
         LOGGER.debug('Grouping {} props', len(group))
 
-        for prop in group:
+        for prop in labels:
             if labels[prop] is not UNSET:
                 continue
             neigh = find_neighbours(prop)
@@ -1022,6 +1252,7 @@ def group_props_auto(
                     todo.update(neigh)
 
         neighbours.clear()  # Discard, no longer useful.
+        grid.clear()
 
         clusters: Dict[int, List[StaticProp]] = defaultdict(list)
         for prop, key in labels.items():
@@ -1033,21 +1264,30 @@ def group_props_auto(
         for cluster in clusters.values():
             warned: bool = False
             todo = set(cluster)
+            # Each loop removes props, so keep a running total of the positions to average, and
+            # look up the vertex counts once.
+            total_pos = sum((prop.origin for prop in cluster), Vec())
+            prop_verts: Dict[StaticProp, int] = {}
+            for prop in cluster:
+                qc, mdl = get_model(prop.model)
+                assert mdl is not None
+                prop_verts[prop] = mdl.total_verts
+
             while len(todo) > min_cluster:
                 # First find the prop the furthest from the center-point.
-                average_pos = sum((prop.origin for prop in todo), Vec()) / len(todo)
-                central_prop = max(todo, key=lambda prop: (prop.origin - average_pos).mag_sq())
+                average_pos = total_pos / len(todo)
+                # Sort first, so ties are broken the same way each time.
+                ordered = sorted(todo, key=prop_order.__getitem__)
+                central_prop = max(ordered, key=lambda prop: (prop.origin - average_pos).mag_sq())
 
                 total_verts = 0
                 selected_props: List[StaticProp] = []
                 found_matches = False
-                for prop in list(todo):
+                for prop in ordered:
                     # Exceeds the max radius?
                     if (prop.origin - central_prop.origin).mag_sq() > max_dist_sq:
                         continue
-                    qc, mdl = get_model(prop.model)
-                    assert mdl is not None
-                    total_verts += mdl.total_verts
+                    total_verts += prop_verts[prop]
                     if total_verts > MAX_VERTS:
                         # Make this just info level, just might be props nearby.
                         if not warned:
@@ -1062,19 +1302,24 @@ def group_props_auto(
                         if len(selected_props) >= min_cluster:
                             found_matches = True
                             todo.difference_update(selected_props)
+                            for sel_prop in selected_props:
+                                total_pos -= sel_prop.origin
                             yield selected_props
                         selected_props = []
-                        total_verts = mdl.total_verts
+                        total_verts = prop_verts[prop]
                     selected_props.append(prop)
 
                 if len(selected_props) >= min_cluster:
                     yield selected_props
                     todo.difference_update(selected_props)
+                    for sel_prop in selected_props:
+                        total_pos -= sel_prop.origin
                     found_matches = True
                 if not found_matches:
                     # The selected prop was too far away to cluster. Discard it, so we pick a
                     # different one. It should be added by itself, it's on its own mostly.
                     todo.discard(central_prop)
+                    total_pos -= central_prop.origin
             # Once the while loop terminates, our group is too small to actually cluster any more.
             # The main combine() function will re-add them to the map automatically.
 
@@ -1100,6 +1345,7 @@ async def combine(
     pack_models: bool=True,
 ) -> None:
     """Combine props in this map."""
+    global _mesh_cache_loc
     LOGGER.debug(
         'Propcombine: decomp cache={}, crowbar={}, studiomdl={}',
         decomp_cache_loc, crowbar_loc, studiomdl_loc,
@@ -1140,6 +1386,7 @@ async def combine(
     # Wipe these, if they're being used again.
     _mesh_cache.clear()
     _coll_cache.clear()
+    _mesh_cache_loc = decomp_cache_loc / MESH_CACHE_NAME if decomp_cache_loc is not None else None
     missing_qcs: Set[str] = set()
 
     async def load_model(key: str, filename: str) -> None:
@@ -1154,21 +1401,22 @@ async def combine(
             LOGGER.debug('Model {} was not found in the filesystem.', filename)
             return
 
+        # Check this first, so we don't parse models we can't do anything with.
+        can_decompile = crowbar_loc is not None and decomp_cache_loc is not None
+        if key not in qc_map and not can_decompile:
+            LOGGER.debug('Model {} has no QC!', filename)
+            missing_qcs.add(filename)
+            return
+
         model = await trio.to_thread.run_sync(Model, pack.fsys, mdl_file)
         if 'no_propcombine' in model.keyvalues.casefold():
             LOGGER.debug('Model {} is blacklisted in the QC.', filename)
             return
 
-        if model is None:
-            return
-
         try:
             qc = qc_map[key]
         except KeyError:
-            if crowbar_loc is None or decomp_cache_loc is None:
-                LOGGER.debug('Model {} has no QC!', filename)
-                missing_qcs.add(filename)
-                return
+            assert crowbar_loc is not None and decomp_cache_loc is not None
             qc = await decompile_model(pack.fsys, decomp_cache_loc, crowbar_loc, filename, model.checksum)
 
         if qc is not None:
@@ -1189,8 +1437,27 @@ async def combine(
         except KeyError:
             return None, None
 
+    # Texture sets for each model and skin, shared with the propcombine volumes.
+    texture_sets: Dict[Tuple[Model, int], FrozenSet[str]] = {}
+
+    def get_texture_set(model: Model, skin: int) -> FrozenSet[str]:
+        """Fetch the set of textures used by a model with this skin."""
+        try:
+            return texture_sets[model, skin]
+        except KeyError:
+            pass
+        textures = texture_sets[model, skin] = frozenset({
+            tex.casefold().replace('\\', '/')
+            for tex in
+            model.iter_textures([skin])
+        })
+        return textures
+
     # Ignore these two, they don't affect our new prop.
     relevant_flags = ~(StaticPropFlags.HAS_LIGHTING_ORIGIN | StaticPropFlags.DOES_FADE)
+    # The parts of the grouping key which only depend on the model and skin.
+    # Many props share these, so only compute them once.
+    model_keys: Dict[Tuple[str, int], Optional[Tuple[FrozenSet[str], int, str]]] = {}
 
     def get_grouping_key(prop: StaticProp) -> Optional[tuple]:
         """Compute a grouping key for this prop.
@@ -1198,23 +1465,34 @@ async def combine(
         Only props with matching key can be possibly combined.
         If None it cannot be combined.
         """
+        mdl_key = (unify_mdl(prop.model), prop.skin)
         try:
-            qc, model = mdl_map[unify_mdl(prop.model)]
+            model_key = model_keys[mdl_key]
         except KeyError:
+            try:
+                qc, model = mdl_map[mdl_key[0]]
+            except KeyError:
+                model_key = None
+            else:
+                model_key = (
+                    get_texture_set(model, prop.skin),
+                    model.contents,
+                    model.surfaceprop,
+                )
+            model_keys[mdl_key] = model_key
+
+        if model_key is None:
             return None
+        textures, contents, surfaceprop = model_key
 
         return (
             # Must be first, we pull this out later.
-            frozenset({
-                tex.casefold().replace('\\', '/')
-                for tex in
-                model.iter_textures([prop.skin])
-            }),
+            textures,
             (prop.flags & relevant_flags).value,
             # Do not allow combining across an areaportal boundary.
             frozenset({leaf.area for leaf in prop.visleafs}),
-            model.contents,
-            model.surfaceprop,
+            contents,
+            surfaceprop,
             prop.renderfx,
             *prop.tint,
         )
@@ -1222,9 +1500,12 @@ async def combine(
     prop_count = 0
 
     # First, construct groups of props that can possibly be combined.
-    prop_groups: Dict[Optional[tuple], List[StaticProp]] = defaultdict(list)
+    prop_groups: Dict[Optional[tuple], Set[StaticProp]] = defaultdict(set)
+    # StaticProp hashes by identity, so keep the original order to sort the sets by.
+    prop_order: Dict[StaticProp, int] = {}
     for prop in bsp.props:
-        prop_groups[get_grouping_key(prop)].append(prop)
+        prop_groups[get_grouping_key(prop)].add(prop)
+        prop_order[prop] = prop_count
         prop_count += 1
 
     # This holds the list of all props we want in the map at the end.
@@ -1239,13 +1520,13 @@ async def combine(
         # then the auto grouper handles that.
         grouper = itertools.chain(
             group_props_ent(
-                prop_groups,
-                get_model,
+                prop_groups, prop_order,
+                get_model, get_texture_set,
                 bsp.bmodels, grouper_ents,
                 min_cluster,
             ),
             group_props_auto(
-                prop_groups,
+                prop_groups, prop_order,
                 get_model,
                 min_auto_range, max_auto_range,
                 min_cluster_auto or min_cluster,
@@ -1254,15 +1535,15 @@ async def combine(
     elif grouper_ents:
         LOGGER.info('Propcombine sets present ({}), combining...', len(grouper_ents))
         grouper = group_props_ent(
-            prop_groups,
-            get_model,
+            prop_groups, prop_order,
+            get_model, get_texture_set,
             bsp.bmodels, grouper_ents,
             min_cluster,
         )
     elif min_auto_range > 0:
         LOGGER.info('Automatically finding propcombine sets...')
         grouper = group_props_auto(
-            prop_groups,
+            prop_groups, prop_order,
             get_model,
             min_auto_range, max_auto_range,
             min_cluster_auto or min_cluster,
@@ -1274,7 +1555,7 @@ async def combine(
 
     # These are models we cannot merge no matter what -
     # no source files etc.
-    cannot_merge = prop_groups.pop(None, [])
+    cannot_merge = sorted(prop_groups.pop(None, set()), key=prop_order.__getitem__)
     final_props.extend(cannot_merge)
 
     LOGGER.debug('Prop groups: \n{}', '\n'.join([
@@ -1295,7 +1576,7 @@ async def combine(
         map_name,
         folder_name='propcombine',
         version={
-            'ver': 2,
+            'ver': 3,
             'vol_tolerance': volume_tolerance,
         },
         compile_dir=compile_dump,
@@ -1312,7 +1593,7 @@ async def combine(
                 nursery.start_soon(do_combine, group_)
                 group_count += 1
 
-    final_props.extend(rejected)
+    final_props.extend(sorted(rejected, key=prop_order.__getitem__))
 
     if debug_dump:
         dump_vmf = VMF()
@@ -0,0 +1,107 @@
+"""Test the async cache."""
+from typing import List
+
+from trio.testing import MockClock
+import trio
+
+from hammeraddons.acache import ACache
+
+
+async def test_fetch_once(autojump_clock: MockClock) -> None:
+    """Concurrent fetches of the same key only compute it once."""
+    cache: ACache[int, int] = ACache()
+    calls: List[int] = []
+
+    async def compute(key: int) -> int:
+        calls.append(key)
+        await trio.sleep(0.01)
+        return key * 2
+
+    results: List[int] = []
+
+    async def fetch(key: int) -> None:
+        results.append(await cache.fetch(key, compute, key))
+
+    async with trio.open_nursery() as nursery:
+        for _ in range(5):
+            nursery.start_soon(fetch, 4)
+    assert calls == [4]
+    assert results == [8] * 5
+    assert list(cache) == [(4, 8)]
+
+
+async def test_lru_eviction() -> None:
+    """The least recently used values are discarded once the size is exceeded."""
+    cache: ACache[int, int] = ACache(2)
+    calls: List[int] = []
+
+    async def compute(key: int) -> int:
+        calls.append(key)
+        return key * 2
+
+    assert await cache.fetch(1, compute, 1) == 2
+    assert await cache.fetch(2, compute, 2) == 4
+    assert await cache.fetch(1, compute, 1) == 2  # Now the most recent.
+    assert await cache.fetch(3, compute, 3) == 6
+    assert sorted(key for key, _ in cache) == [1, 3]
+    assert await cache.fetch(1, compute, 1) == 2
+    assert await cache.fetch(2, compute, 2) == 4
+    assert calls == [1, 2, 3, 2]
+
+    cache.load(5, 10)
+    assert sorted(key for key, _ in cache) == [2, 5]
+
+
+async def test_concurrent_eviction(autojump_clock: MockClock) -> None:
+    """Values being computed don't count towards the size, and waiters still get the result."""
+    cache: ACache[int, int] = ACache(2)
+    calls: List[int] = []
+    results: List[int] = []
+
+    async def compute(key: int, delay: float) -> int:
+        calls.append(key)
+        await trio.sleep(delay)
+        return key * 2
+
+    async def fetch(key: int, delay: float) -> None:
+        results.append(await cache.fetch(key, compute, key, delay))
+
+    async with trio.open_nursery() as nursery:
+        # Several slow fetches are in flight while the fast one completes.
+        for key in range(3):
+            nursery.start_soon(fetch, key, 0.5)
+        for _ in range(5):
+            nursery.start_soon(fetch, 10, 0.01)
+    assert sorted(calls) == [0, 1, 2, 10]
+    assert sorted(results) == [0, 2, 4] + [20] * 5
+    assert len(list(cache)) == 2
+
+
+async def test_failure_retries(autojump_clock: MockClock) -> None:
+    """If the computation fails, a waiter computes it again."""
+    cache: ACache[int, int] = ACache()
+    calls: List[int] = []
+
+    async def compute(key: int) -> int:
+        calls.append(key)
+        await trio.sleep(0.01)
+        if len(calls) == 1:
+            raise ValueError
+        return key
+
+    async def first() -> None:
+        try:
+            await cache.fetch(1, compute, 1)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('Should fail.')
+
+    async def second() -> None:
+        await trio.sleep(0.001)
+        assert await cache.fetch(1, compute, 1) == 1
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(first)
+        nursery.start_soon(second)
+    assert calls == [1, 1]
@@ -0,0 +1,134 @@
+"""Test propcombine helper logic."""
+from pathlib import Path
+from typing import List
+import os
+
+from srctools.math import Vec
+from srctools.smd import ParseError
+import pytest
+
+from hammeraddons import propcombine
+from hammeraddons.propcombine import CollType, PropPos, iter_qcs, load_qcs, load_smd, prop_key
+
+
+SMD = """\
+version 1
+nodes
+0 "static_prop" -1
+end
+skeleton
+time 0
+0 0 0 0 0 0 0
+end
+triangles
+tools/toolsnodraw
+0 0 0 0 0 0 1 0 0 1 0 1
+0 1 0 0 0 0 1 0 0 1 0 1
+0 0 1 0 0 0 1 0 0 1 0 1
+end
+"""
+
+
+def make_pos(x: float, model: str = 'models/props/crate.mdl') -> PropPos:
+    """Construct a prop position with defaults."""
+    return PropPos(
+        x, 0.0, 0.0,
+        0.0, 90.0, 0.0,
+        model, b'1234', 0,
+        1.0, 1.0, 1.0,
+        CollType.VPHYS,
+    )
+
+
+def test_prop_key_order() -> None:
+    """The order of the props doesn't affect the key."""
+    a = make_pos(1.0)
+    b = make_pos(2.0, 'models/props/barrel.mdl')
+    c = make_pos(-3.5)
+    assert prop_key([a, b, c], True) == prop_key([c, a, b], True) == prop_key({b, c, a}, True)
+    assert prop_key([a, b], True) != prop_key([a, c], True)
+    assert len(prop_key([a, b, c], True)) == 16
+
+
+def test_prop_key_collision() -> None:
+    """Whether collisions are generated affects the key."""
+    props = [make_pos(1.0), make_pos(2.0)]
+    assert prop_key(props, True) != prop_key(props, False)
+
+
+def test_prop_key_negative_zero() -> None:
+    """-0.0 and 0.0 compare equal, so they must produce the same key."""
+    neg_zero = round(Vec(-1e-9, 0, 0), 7).x
+    assert str(neg_zero) == '-0.0'
+    neg = [make_pos(neg_zero), make_pos(5.0)]
+    pos = [make_pos(0.0), make_pos(5.0)]
+    assert frozenset(neg) == frozenset(pos)
+    assert prop_key(neg, False) == prop_key(pos, False)
+
+
+def test_iter_qcs_order(tmp_path: Path) -> None:
+    """QCs are found in the same order as os.walk(), so duplicates override the same way."""
+    for folder in ['b', 'c', 'sub', 'a', 'b/x', 'b/y', 'a/z', 'c/sub2']:
+        (tmp_path / folder).mkdir(parents=True, exist_ok=True)
+        (tmp_path / folder / 'model.qc').touch()
+        (tmp_path / folder / 'ref.smd').touch()
+    (tmp_path / 'top.qc').touch()
+
+    expected = [
+        os.path.join(dirpath, fname)
+        for dirpath, dirnames, filenames in os.walk(str(tmp_path))
+        for fname in filenames
+        if fname.endswith('.qc')
+    ]
+    assert [entry.path for entry in iter_qcs(str(tmp_path))] == expected
+
+
+def test_load_qcs_warning_replay(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Warnings for unusable QCs are logged again when the result comes from the cache."""
+    (tmp_path / 'good.qc').write_text('$modelname "props/good.mdl"\n$body body "ref.smd"\n')
+    (tmp_path / 'bad.qc').write_text('$body body "ref.smd"\n')
+    (tmp_path / 'dmx.qc').write_text('$modelname "props/dmx.mdl"\n$body body "ref.dmx"\n')
+    warnings: List[str] = []
+    monkeypatch.setattr(
+        propcombine.LOGGER, 'warning',
+        lambda msg, *args, **kwargs: warnings.append(msg.format(*args)),
+    )
+
+    first = list(load_qcs(tmp_path))
+    assert (tmp_path / propcombine.QC_CACHE_NAME).exists()
+    assert [name for name, qc in first] == ['models/props/good.mdl']
+    assert len(warnings) == 2
+    assert any(warn.startswith('Cannot parse') for warn in warnings)
+    assert any(warn.startswith('Reference mesh not a SMD') for warn in warnings)
+
+    first_warnings = sorted(warnings)
+    warnings.clear()
+    monkeypatch.setattr(propcombine, 'load_qc', None)  # Must not be parsed again.
+    assert list(load_qcs(tmp_path)) == first
+    assert sorted(warnings) == first_warnings
+
+
+def test_load_smd_cache(tmp_path: Path) -> None:
+    """Parsed SMDs are reused from the cache until the file changes."""
+    smd = tmp_path / 'ref.smd'
+    smd.write_text(SMD)
+    cache_loc = tmp_path / 'cache'
+
+    mesh = load_smd(str(smd), cache_loc)
+    assert len(mesh.triangles) == 1
+    [cache_file] = cache_loc.iterdir()
+    # Modify the result, the cached copy should be unaffected.
+    mesh.triangles[0].mat = 'changed'
+    cached = load_smd(str(smd), cache_loc)
+    assert cached is not mesh
+    assert cached.triangles[0].mat == 'tools/toolsnodraw'
+
+    smd.write_text(SMD.replace('tools/toolsnodraw', 'tools/toolsclip'))
+    assert load_smd(str(smd), cache_loc).triangles[0].mat == 'tools/toolsclip'
+    assert load_smd(str(smd), None).triangles[0].mat == 'tools/toolsclip'
+
+    # A stale cache file is removed, even if the SMD then fails to parse.
+    smd.write_text('garbage\n')
+    with pytest.raises(ParseError):
+        load_smd(str(smd), cache_loc)
+    assert not cache_file.exists()